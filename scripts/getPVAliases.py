@@ -7,17 +7,49 @@ A script for gathering alias associations from an IOC
 ###############################################################################
 
 import argparse
-import copy
+import itertools
 import os.path
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
 
 from colorama import Fore, Style
 from constants import VALID_HUTCH
 from grep_more_ioc import (clean_ansi, find_ioc, find_parent_ioc, fix_dir,
-                           search_file, simple_prompt)
+                           simple_prompt)
 from prettytable import PrettyTable
 
+###############################################################################
+# %% Global settings
+###############################################################################
+# Thread count for the I/O bound lookups across the child and parent IOCs
+MAX_WORKERS = 16
+
+# Output line for each PV <--> alias pair, padded to the 61 char max
+# record name
+_ALIAS_LINE_FMT = '%-61s%-61s'
+
+# Messages for the interactive IOC loop in main()
+_MSG_SKIP_DISABLED = f'{Fore.RED}Skipping disabled child IOCs{Style.RESET_ALL}'
+_MSG_SUBS_FOUND = (f'{Fore.LIGHTGREEN_EX}The following substitutions were '
+                   f'found in the st.cmd:{Style.RESET_ALL}')
+_MSG_SAVE_ALL = ('Do you want to save all resulting PV <--> alias '
+                 'associations found in this st.cmd?\n'
+                 f'This will append {Fore.LIGHTYELLOW_EX}{{}}{Style.RESET_ALL}'
+                 ' record <--> alias sets to your final output (y/N): ')
+_MSG_PV_BUILT = (f'{Fore.LIGHTGREEN_EX}The following PV aliases are built:'
+                 f'{Style.RESET_ALL}')
+
+# Precompiled regex patterns for the st.cmd and alias.db substitutions
+_ALIAS_PREFIX_RE = re.compile(r'alias\(| +')
+_PAREN_NL_RE = re.compile(r'\)\s*\n')
+_RECORD_RE = re.compile(r'\$\(RECORD\)')
+_ALIAS_RE = re.compile(r'\$\(ALIAS\)')
+_ALIAS_LOAD_RE = re.compile(rb'db/alias\.db.*"RECORD=([^,"\s]+)\s*,\s*'
+                            rb'ALIAS=([^,"\s]+)')
+
 ###############################################################################
 # %% Functions
 ###############################################################################
@@ -78,11 +110,8 @@ def build_table(input_data: list[dict], columns: list[str] = None,
     """
 
     if columns is None:
-        col_list = []
-    # First get all unique key values from the dict
-        for _d in input_data:
-            col_list.extend(list(_d.keys()))
-        cols = sorted(list(set(col_list)))
+        # First get all unique key values from the dicts
+        cols = sorted(set(itertools.chain.from_iterable(input_data)))
     else:
         cols = columns
     # initialize the table
@@ -91,8 +120,8 @@ def build_table(input_data: list[dict], columns: list[str] = None,
     for c in cols:
         _tbl.add_column(c, [], **kwargs)
     # add the data, strip ANSI color from color headers if any
-    for _d in input_data:
-        _tbl.add_row([_d.get(clean_ansi(c), '') for c in cols])
+    clean_cols = [clean_ansi(c) for c in cols]
+    _tbl.add_rows([[_d.get(c, '') for c in clean_cols] for _d in input_data])
     return _tbl
 
 
@@ -118,14 +147,37 @@ def acquire_aliases(dir_path: str, ioc: str) -> list[dict]:
     """
     _d = fix_dir(dir_path)
     _f = f'{_d}build/iocBoot/{ioc}/st.cmd'
-    if os.path.exists(_f) is False:
+    try:
+        with open(_f, 'rb') as _fh:
+            data = _fh.read()
+    except OSError:
         print(f'{_f} does not exist')
         return ''
-    search_result = search_file(file=_f, patt=r'db/alias.db')
-    _temp = re.findall(r'"RECORD=.*"', search_result)
-    output = [re.sub(r'\"|\)|RECORD\=|ALIAS\=', '', s).split(',')
-              for s in _temp]
-    return [{'record': s[0], 'alias': s[-1]} for s in output]
+    # capture the record and alias of each alias.db load in a single scan,
+    # only decoding the captured names
+    return [{'record': record.decode(), 'alias': alias.decode()}
+            for record, alias in _ALIAS_LOAD_RE.findall(data)]
+
+
+@lru_cache(maxsize=None)
+def _load_alias_template(parent_release: str) -> Optional[str]:
+    """
+    Reads the parent db/alias.db file once and returns it as a str.format
+    template with {record} and {alias} placeholders, or None if the file
+    does not exist.
+    """
+    try:
+        with open(f'{parent_release}/db/alias.db', encoding='utf-8') as _f:
+            _temp = _f.read()
+    except OSError:
+        return None
+    # remove the 'alias' prefix from the tuple
+    _temp = _ALIAS_PREFIX_RE.sub('', _temp)
+    _temp = _PAREN_NL_RE.sub('\n', _temp)
+    # escape any literal braces, then convert the macros to placeholders
+    _temp = _temp.replace('{', '{{').replace('}', '}}')
+    _temp = _RECORD_RE.sub('{record}', _temp)
+    return _ALIAS_RE.sub('{alias}', _temp)
 
 
 def process_alias_template(parent_release: str, record: str,
@@ -152,19 +204,12 @@ def process_alias_template(parent_release: str, record: str,
 
     """
 
-    _target_file = f'{parent_release}/db/alias.db'
-    if os.path.exists(_target_file):
-        with open(_target_file, encoding='utf-8') as _f:
-            _temp = _f.read()
-    else:
+    template = _load_alias_template(parent_release)
+    if template is None:
         print(f'{parent_release} does not exist')
         return None
-    # remove the 'alias' prefix from the tuple
-    _temp = re.sub(r'alias\(| +', '', _temp)
-    _temp = re.sub(r'\)\s*\n', '\n', _temp)
     # then make the substitutions
-    _temp = re.sub(r'\$\(RECORD\)', record, _temp)
-    _temp = re.sub(r'\$\(ALIAS\)', alias, _temp)
+    _temp = template.format(record=record, alias=alias)
     return [s.replace('"', '').split(',') for s in _temp.split()]
 
 
@@ -173,8 +218,9 @@ def show_temp_table(input_data: list, col_list: list):
     Formats the 'disable' column in the find_ioc json output for clarity
     and prints the pretty table to the terminal.
     """
-    # color code the disable state for easier comprehensions
-    temp = copy.deepcopy(input_data)
+    # color code the disable state for easier comprehensions, a shallow
+    # copy is enough since only the top level 'disable' value is replaced
+    temp = [{**_d} for _d in input_data]
     for _d in temp:
         if _d.get('disable') is not None:
             if _d.get('disable') is True:
@@ -231,9 +277,17 @@ def main():
               + f'{args.hutch}')
         sys.exit()
 
-    # find the parent directories
-    for _d in data:
-        _d['parent_ioc'] = find_parent_ioc(_d['id'], _d['dir'])
+    # find the parent directories, overlapping the slow file system reads
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        parents = list(executor.map(find_parent_ioc,
+                                    [_d['id'] for _d in data],
+                                    [_d['dir'] for _d in data]))
+        for _d, parent in zip(data, parents):
+            _d['parent_ioc'] = parent
+        # prefetch the alias templates of the parents we'll actually use
+        list(executor.map(_load_alias_template,
+                          {_d['parent_ioc'] for _d in data
+                           if _d.get('disable') is not True}))
 
     # Hard code the column order for the find_ioc output
     column_list = ['id', 'dir',
@@ -249,7 +303,7 @@ def main():
     # Abort if user gets cold feet
     if ans is False:
         sys.exit()
-    print(f'{Fore.RED}Skipping disabled child IOCs{Style.RESET_ALL}')
+    print(_MSG_SKIP_DISABLED)
 
     # initialize the final output to write to file
     final_output = []
@@ -260,19 +314,10 @@ def main():
             # first acquire the base alias dictionary
             alias_dicts = acquire_aliases(_ioc['dir'], _ioc['id'])
             # show the record aliases to the user
-            print(Fore.LIGHTGREEN_EX
-                  + 'The following substitutions were found in the st.cmd:'
-                  + Style.RESET_ALL)
+            print(_MSG_SUBS_FOUND)
             print(build_table(alias_dicts, ['record', 'alias'], align='l'))
             # optional skip for all resulting PV aliases
-            save_all = (simple_prompt(
-                'Do you want to save all resulting PV <--> alias '
-                + 'associations found in this st.cmd?\n'
-                + 'This will append '
-                + Fore.LIGHTYELLOW_EX
-                + f'{len(alias_dicts)}'
-                + Style.RESET_ALL
-                + ' record <--> alias sets to your final output (y/N): '))
+            save_all = simple_prompt(_MSG_SAVE_ALL.format(len(alias_dicts)))
 
             # initialize flags
             skip_all = None
@@ -287,15 +332,14 @@ def main():
                 alias_list = process_alias_template(_ioc['parent_ioc'],
                                                     a['record'], a['alias'])
                 # capture output based on 61 char max record name
-                _chunk = [f"{al[0]:<61}{al[-1]:<61}" for al in alias_list]
+                _chunk = [_ALIAS_LINE_FMT % (al[0], al[-1])
+                          for al in alias_list]
                 # Demonstrate PV aliases on first iteration
                 if (i == 0) | ((show_pvs is True) & (skip_all is False)):
                     # show output to user, building a temp list of dict first
                     _temp = [{'PV': al[0], 'Alias': al[-1]}
                              for al in alias_list]
-                    print(Fore.LIGHTGREEN_EX
-                          + 'The following PV aliases are built:'
-                          + Style.RESET_ALL)
+                    print(_MSG_PV_BUILT)
                     print(build_table(_temp, ['PV', 'Alias'], align='l'))
                     del _temp
 
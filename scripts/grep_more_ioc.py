@@ -7,11 +7,11 @@ A tool for enhancing the grep_ioc CLI tool for ECS-Delivery team
 ###############################################################################
 
 import argparse
-import glob as gb
 import json
 import os.path
 import re
 import sys
+from functools import lru_cache
 from shutil import get_terminal_size
 
 import pandas as pd
@@ -26,6 +26,20 @@ from constants import DEF_IMGR_KEYS, VALID_HUTCH
 
 pd.set_option("display.max_rows", 1000)
 
+# Precompiled regex patterns, reused across every IOC and cfg file searched
+_ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# Single pass fix_json scan: unquoted keys, booleans and unquoted digits
+_FIXJSON_PATT = (r"(?P<key>(?:{keys})(?=\s?:\s?))|(?P<true>True)"
+                 r"|(?P<false>False)|(?P<num>(?<=:)\d+)")
+_FIXJSON_RE = re.compile(
+    _FIXJSON_PATT.format(keys='|'.join(map(re.escape, DEF_IMGR_KEYS))))
+# Trailing commas after and stray spaces before the IOC json objects
+_BRACE_RE = re.compile(r'(?<=\}),| (?=\{)')
+# Translation table for swapping to json style double quotes
+_QUOTE_TBL = str.maketrans({"'": '"'})
+# Regex metacharacters, used to decide if a pattern is a plain literal
+_REGEX_META_RE = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
 ###############################################################################
 # %% Functions
 ###############################################################################
@@ -33,19 +47,23 @@ pd.set_option("display.max_rows", 1000)
 
 def search_file(*, file: str, output: list = None,
                 patt: str = None, prefix: str = '',
-                quiet: bool = False, color_wrap: Fore = None) -> str:
+                quiet: bool = False, color_wrap: Fore = None,
+                literal: str = None) -> list[str]:
     """
-    Searches file for regex match and appends the result to a list,
-    then formats back into a str with the prefix prepended.
+    Searches file for regex match and appends each matching line to a
+    list with the prefix prepended.
 
     Parameters
     ----------
     file: str
-        The file to read and search. Encoding must be utf-8
+        The file to read and search. Encoding must be utf-8, and is
+        searched as raw bytes.
     output: list, optional
         A list to appead your results to. The default is None.
-    patt: str, optional
-        The regex pattern to search for. The default is None.
+    patt: str or re.Pattern, optional
+        The regex pattern to search for, either as a str or precompiled.
+        It is converted to a bytes pattern for the search.
+        The default is None.
     prefix: str, optional
         A str prefix to add to each line. The default is ''.
     color_wrap: Fore, optional
@@ -53,11 +71,15 @@ def search_file(*, file: str, output: list = None,
     quiet: bool, optional
         Whether to surpress the warning printed to terminal when "file"
         does not exist. The default is False.
+    literal: str, optional
+        A plain substring every match must contain. Files and lines
+        without it are skipped. The default is None.
 
     Returns
     -------
     list[str]
-        A list of the search results with the prefix prepended.
+        A list of the search results with the prefix prepended, one
+        matching line per entry without the trailing line break.
     """
     if output is None:
         output = []
@@ -66,19 +88,40 @@ def search_file(*, file: str, output: list = None,
     if color_wrap is not None:
         color = color_wrap
         reset = Style.RESET_ALL
-    if os.path.isfile(file) is False:
+    # The files are ASCII, so scan the raw bytes and only decode the matches
+    flags = 0
+    if isinstance(patt, re.Pattern):
+        flags = patt.flags & ~re.UNICODE
+        patt = patt.pattern
+    if isinstance(patt, str):
+        patt = patt.encode()
+    _patt = re.compile(patt, flags)
+    repl = (color + r'\g<0>' + reset).encode()
+    # just try to open the file, rather than stat it first
+    try:
+        with open(file, 'rb') as _f:
+            data = _f.read()
+    except OSError:
         if not quiet:
             print(f'{file} does not exist')
-        return ''
-    with open(file, 'r', encoding='utf-8') as _f:
-        for line in _f.readlines():
-            if re.search(patt, line):
-                output.append(re.sub(patt, color + r'\g<0>' + reset, line))
-        return prefix + prefix.join(output)
+        return output
+    # skip the whole file if it can't possibly match
+    if literal:
+        literal = literal.encode()
+        if literal not in data:
+            return output
+    # split all the lines in one go, whatever the line endings, but search
+    # them one at a time so matches never span a line break
+    for line in data.splitlines():
+        if literal and literal not in line:
+            continue
+        if _patt.search(line):
+            output.append(prefix + _patt.sub(repl, line).decode('utf-8'))
+    return output
 
 
 def search_procmgr(*, file: str, patt: str = None, output: list = None,
-                   prefix: str = '') -> str:
+                   prefix: str = '', literal: str = None) -> str:
     """
     Very similar to search_file, except it is to be used exclusively with
     iocmanager.cfg files. Grabs the procmgr_cfg lists and searches the
@@ -95,6 +138,9 @@ def search_procmgr(*, file: str, patt: str = None, output: list = None,
         A list to append the results to. The default is None.
     prefix : str, optional
         A prefix to add to the start of each result. The default is ''.
+    literal : str, optional
+        A plain substring every IOC entry must contain. Entries without it
+        are dropped before running the regex. The default is None.
 
     Returns
     -------
@@ -108,16 +154,24 @@ def search_procmgr(*, file: str, patt: str = None, output: list = None,
         output = []
     _patt = r'{.*' + patt + r'.*}'
     # First open the iocmanager.cfg, if it exists
-    if not (os.path.exists(file) and ('iocmanager.cfg' in file)):
+    if 'iocmanager.cfg' not in file:
+        print(f'{file} does not exist or is otherwise invalid.')
+        return ''
+    try:
+        with open(file, 'r', encoding='utf-8') as _f:
+            raw_text = _f.read()
+    except OSError:
         print(f'{file} does not exist or is otherwise invalid.')
         return ''
-    with open(file, 'r', encoding='utf-8') as _f:
-        raw_text = _f.read()
     # then only grab the procmgr_cfg for the search
     pmgr_key = r'procmgr_config = [\n '
     pmgr = raw_text[(raw_text.find(pmgr_key)+len(pmgr_key)):-3]
     # get rid of those pesty inline breaks within the JSOB obj
     pmgr = pmgr.replace(',\n ', ',').replace('},{', '},\n{')
+    # skip the regex engine for IOC entries that can't possibly match
+    if literal:
+        pmgr = '\n'.join(line for line in pmgr.split('\n')
+                         if literal in line)
     # now let we'll finally search through the IOCs and insert into output
     output.extend(re.findall(_patt, pmgr))
     # now return the searches with the prefix prepended and the necessary
@@ -125,6 +179,13 @@ def search_procmgr(*, file: str, patt: str = None, output: list = None,
     return prefix + prefix.join([s + '\n' for s in output])
 
 
+def get_literal(patt: str) -> str:
+    """Returns 'patt' if it has no regex metacharacters, else None"""
+    if _REGEX_META_RE.search(patt) is None:
+        return patt
+    return None
+
+
 def print_skip_comments(file: str):
     """Prints contents of a file while ignoring comments"""
     try:
@@ -141,13 +202,13 @@ def print_skip_comments(file: str):
 def simple_prompt(prompt: str, default: str = 'N'):
     """Simple yes/no prompt which defaults to No"""
     while True:
-        p = input(prompt).strip().lower()
-        if p in ['']:
-            p = default.lower()
-        if p[0] == 'y':
+        p = input(prompt).strip()
+        # only the first character matters, fall back on the default
+        c = (p[:1] or default[:1]).lower()
+        if c == 'y':
             result = True
             break
-        if p.lower()[0] == 'n':
+        if c == 'n':
             result = False
             break
         print('Invalid Entry. Please choose again.')
@@ -158,8 +219,17 @@ def clean_ansi(text: str = None) -> str:
     """
     Removes ANSI escape sequences from a str, including fg/bg formatting.
     """
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    return ansi_escape.sub('', text)
+    return _ANSI_RE.sub('', text)
+
+
+def _fix_json_token(match: re.Match) -> str:
+    """Replacement callback for the tokens matched by _FIXJSON_RE"""
+    if match.lastgroup == 'true':
+        return 'true'
+    if match.lastgroup == 'false':
+        return 'false'
+    # keys and digits just need to be quoted
+    return f"'{match.group()}'"
 
 
 def fix_json(raw_data: str, keys: list[str] = None) -> list[str]:
@@ -178,21 +248,15 @@ def fix_json(raw_data: str, keys: list[str] = None) -> list[str]:
         The list of str ready for JSON loading
     """
     if keys is None:
-        valid_keys = re.compile(r'(?=\s?:\s?)|'.join(DEF_IMGR_KEYS))
-    # clean empty rows and white space
-    _temp = raw_data.replace(' ', '').strip()
-    # capture and fix the keys not properly formatted to str
-    _temp = re.sub(valid_keys, r"'\g<0>'", raw_data)
-    # capture boolean tokens and fix them for json format
-    _temp = re.sub("True", "true", _temp)
-    _temp = re.sub("False", "false", _temp)
-    # then capture and fix digits not formatted to str
-    _temp = re.sub(r"(?<=:)\d+", r"'\g<0>'", _temp)
+        fix_patt = _FIXJSON_RE
+    else:
+        fix_patt = re.compile(
+            _FIXJSON_PATT.format(keys='|'.join(map(re.escape, keys))))
+    # quote the keys and digits, and fix the booleans for json format,
+    # all in a single scan
+    _temp = fix_patt.sub(_fix_json_token, raw_data)
     # then properly convert to list of json obj
-    result = (_temp
-              .replace('\'', '\"')
-              .replace('},', '}')
-              .replace(' {', '{')
+    result = (_BRACE_RE.sub('', _temp.translate(_QUOTE_TBL))
               .strip()
               .split('\n'))
     return result
@@ -230,49 +294,40 @@ def find_ioc(hutch: str = None, patt: str = None,
         print('Invalid entry. Please choose a valid hutch:\n'
               + ','.join(valid_hutch))
         raise ValueError
-    # create file paths
-    if hutch in tuple(valid_hutch):
-        if hutch == 'all':
-            path = gb.glob('/cds/group/pcds/pyps/config/*/iocmanager.cfg')
-        else:
-            path = [f'/cds/group/pcds/pyps/config/{hutch}/iocmanager.cfg']
+    # the hutch code doubles as the iocmanager.cfg's parent directory
+    if hutch == 'all':
+        hutches = [h for h in valid_hutch if h != 'all']
+    else:
+        hutches = [hutch]
     # check patt and generate the regex pattern
     if patt is None:
         print('No regex pattern supplied')
         raise ValueError
+    # plain text patterns can be prefiltered with a substring check
+    literal = get_literal(patt)
     # initialize output list
-    result = []
-    # iterate and capture results.
-    for _file in path:
-        prefix = ''
-        if len(path) != 1:
-            prefix = _file+':'
-        output = search_procmgr(file=_file, patt=patt, prefix=prefix)
-        if output != prefix:
-            result.append(output)
-    # reconstruct the list of str
-    _temp = ''.join(result)
-    if len(_temp) == 0:
+    output = []
+    # iterate and capture results, converting back to json as we go
+    for _hutch in hutches:
+        _file = f'/cds/group/pcds/pyps/config/{_hutch}/iocmanager.cfg'
+        result = search_procmgr(file=_file, patt=patt, literal=literal)
+        if len(result) == 0:
+            continue
+        for s in fix_json(result):
+            _d = json.loads(s)
+            # and add the hutch into the dicts if searching across all cfgs
+            if hutch == 'all':
+                _d['hutch'] = _hutch
+            output.append(_d)
+    if len(output) == 0:
         print(f'{Fore.RED}No results found for {Style.RESET_ALL}{patt}'
               + f'{Fore.RED} in{Style.RESET_ALL} '
               + f'{hutch}')
         return None
-    # capture the hutch from the cfg path if hutch = all
-    if hutch == 'all':
-        hutch_cfgs = re.findall(r'/.*cfg\:', _temp)
-        hutch_cfgs = [''.join(re.findall(r'(?<=/)\w+(?=/ioc)', s))
-                      for s in hutch_cfgs]
-    # strip the file information
-    _temp = re.sub(r'.*cfg\:', '', _temp)
-    # now convert back to json and load
-    output = [json.loads(s) for s in fix_json(_temp)]
-    # and add the hutches back into the dicts if searching across all cfgs
-    if hutch == 'all':
-        for _i, _d in enumerate(output):
-            _d['hutch'] = hutch_cfgs[_i]
     return output
 
 
+@lru_cache(maxsize=None)
 def fix_dir(dir_path: str) -> str:
     """
     Simple function for repairing the child release IOC path based on
@@ -305,10 +360,12 @@ def fix_dir(dir_path: str) -> str:
     return output_dir
 
 
+@lru_cache(maxsize=None)
 def find_parent_ioc(file: str, path: str) -> str:
     """
     Searches the child IOC for the parent's release pointer
-    Returns the parent's IOC as a str.
+    Returns the parent's IOC as a str. Results are cached, so each
+    child IOC.cfg is only read once per run.
 
     Parameters
     ----------
@@ -324,10 +381,16 @@ def find_parent_ioc(file: str, path: str) -> str:
 
     """
     file_dir = fix_dir(path)
-    if os.path.exists(f'{file_dir}{file}.cfg') is False:
+    parent_ioc_release = ''
+    try:
+        with open(f'{file_dir}{file}.cfg', 'rb') as _f:
+            for line in _f:
+                # stop reading as soon as the release pointer is found
+                if line.startswith(b'RELEASE'):
+                    parent_ioc_release = line.decode('utf-8').strip()
+                    break
+    except OSError:
         return 'Invalid. Child does not exist.'
-    parent_ioc_release = search_file(file=f'{file_dir}{file}.cfg',
-                                     patt='^RELEASE').strip()
     return parent_ioc_release.rsplit('=', maxsplit=1)[-1]
 
 
@@ -556,15 +619,14 @@ def main():
             target_dir = fix_dir(d)
             # Search for pattern after moving into the directory
             if args.search is not None:
-                search_result = (search_file(file=f'{target_dir}{ioc}.cfg',
-                                             patt=args.search,
-                                             color_wrap=Fore.LIGHTRED_EX,
-                                             quiet=args.quiet)
-                                 .strip()
-                                 )
+                search_result = search_file(file=f'{target_dir}{ioc}.cfg',
+                                            patt=args.search,
+                                            literal=get_literal(args.search),
+                                            color_wrap=Fore.LIGHTRED_EX,
+                                            quiet=args.quiet)
                 if len(search_result) > 0:
                     print(f'{Fore.LIGHTYELLOW_EX}{ioc}:{Style.RESET_ALL}')
-                    print(''.join(search_result.strip()))
+                    print('\n'.join(search_result).strip())
                     check_search.append(len(search_result))
         if len(check_search) == 0:
             print(Fore.RED + 'No search results found' + Style.RESET_ALL)